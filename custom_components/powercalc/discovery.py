@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import logging
 import re
+from collections import deque
 from typing import Optional
 
 import homeassistant.helpers.device_registry as dr
@@ -10,7 +11,7 @@ from homeassistant.components.light import DOMAIN as LIGHT_DOMAIN
 from homeassistant.components.sensor import DOMAIN as SENSOR_DOMAIN
 from homeassistant.config_entries import SOURCE_INTEGRATION_DISCOVERY, SOURCE_USER
 from homeassistant.const import CONF_ENTITY_ID, CONF_PLATFORM
-from homeassistant.core import HomeAssistant, callback
+from homeassistant.core import HomeAssistant, callback, split_entity_id
 from homeassistant.helpers import discovery, discovery_flow
 from homeassistant.helpers.entity import EntityCategory
 from homeassistant.helpers.typing import ConfigType
@@ -35,32 +36,46 @@ from .power_profile.power_profile import DEVICE_DOMAINS, PowerProfile
 
 _LOGGER = logging.getLogger(__name__)
 
+_WLED_SUBENTITY_RE = re.compile(r"master|segment", re.IGNORECASE)
+_ALLOWED_DOMAINS: frozenset[str] = frozenset(DEVICE_DOMAINS.values())
+_REJECTED_CATEGORIES: frozenset[EntityCategory] = frozenset(
+    {EntityCategory.CONFIG, EntityCategory.DIAGNOSTIC}
+)
+
 
 async def autodiscover_model(
-    hass: HomeAssistant, entity_entry: er.RegistryEntry | None
+    hass: HomeAssistant,
+    entity_entry: er.RegistryEntry | None,
+    device_registry: dr.DeviceRegistry | None = None,
 ) -> ModelInfo | None:
     """Try to auto discover manufacturer and model from the known device information"""
     if not entity_entry:
         return None
 
-    if not await has_manufacturer_and_model_information(hass, entity_entry):
+    if device_registry is None:
+        device_registry = dr.async_get(hass)
+    device_entry = device_registry.async_get(entity_entry.device_id)
+    # A missing (None) manufacturer or model is still accepted, so a partial user configuration can complement it
+    if (
+        device_entry is None
+        or device_entry.manufacturer == ""
+        or device_entry.model == ""
+    ):
         _LOGGER.debug(
             "%s: Cannot autodiscover model, manufacturer or model unknown from device registry",
             entity_entry.entity_id,
         )
         return None
 
-    device_registry = dr.async_get(hass)
-    device_entry = device_registry.async_get(entity_entry.device_id)
-    model_id = device_entry.model
-
-    manufacturer = device_entry.manufacturer
-    if MANUFACTURER_ALIASES.get(manufacturer):
-        manufacturer = MANUFACTURER_ALIASES.get(manufacturer)
+    manufacturer = MANUFACTURER_ALIASES.get(
+        device_entry.manufacturer, device_entry.manufacturer
+    )
 
     # Make sure we don't have a literal / in model_id, so we don't get issues with sublut directory matching down the road
     # See github #658
-    model_id = str(model_id).replace("/", "#slash#")
+    model_id = str(device_entry.model)
+    if "/" in model_id:
+        model_id = model_id.replace("/", "#slash#")
 
     model_info = ModelInfo(manufacturer, model_id)
 
@@ -73,20 +88,33 @@ async def autodiscover_model(
     return model_info
 
 
-async def has_manufacturer_and_model_information(
-    hass: HomeAssistant, entity_entry: er.RegistryEntry
+def _is_entity_domain_supported(
+    power_profile: PowerProfile, entity_entry: er.RegistryEntry
 ) -> bool:
-    """See if we have enough information in device registry to automatically setup the power sensor"""
-
-    device_registry = dr.async_get(hass)
-    device_entry = device_registry.async_get(entity_entry.device_id)
-    if device_entry is None:
-        return False
+    """
+    Check whether the power profile supports the domain of a registry entry.
+    This only needs the domain and registry entry, so we don't have to create the full source entity
+    """
+    return power_profile.is_entity_domain_supported(
+        SourceEntity(
+            object_id=split_entity_id(entity_entry.entity_id)[1],
+            entity_id=entity_entry.entity_id,
+            domain=entity_entry.domain,
+            entity_entry=entity_entry,
+        )
+    )
 
-    if len(str(device_entry.manufacturer)) == 0 or len(str(device_entry.model)) == 0:
-        return False
 
-    return True
+def _get_candidate_entity_ids(entity_registry: er.EntityRegistry) -> tuple[str, ...]:
+    """
+    Collect the entity id's of the registry entries which are in one of the domains supported by the library.
+    Only the entity id's are snapshotted, as the registry can change while discovery is running.
+    """
+    return tuple(
+        entity_entry.entity_id
+        for entity_entry in entity_registry.entities.values()
+        if entity_entry.domain in _ALLOWED_DOMAINS
+    )
 
 
 class DiscoveryManager:
@@ -99,36 +127,52 @@ class DiscoveryManager:
     def __init__(self, hass: HomeAssistant, ha_config: ConfigType):
         self.hass = hass
         self.ha_config = ha_config
-        self.manually_configured_entities: list[str] | None = None
+        self.manually_configured_entities: set[str] | None = None
 
     async def start_discovery(self) -> None:
         """Start the discovery procedure"""
 
         _LOGGER.debug("Start auto discovering entities")
+        discoveries: list[dict] = []
+        try:
+            await self._find_discoveries(discoveries)
+        finally:
+            # Also dispatch the entities found so far when the discovery run is aborted
+            self._dispatch_discoveries(discoveries)
+
+        _LOGGER.debug("Done auto discovering entities")
+
+    async def _find_discoveries(self, discoveries: list[dict]) -> None:
+        """Scan the entity registry and add the discovery data of all supported entities to discoveries"""
         entity_registry = er.async_get(self.hass)
-        for entity_entry in list(entity_registry.entities.values()):
-            if not self.should_process_entity(entity_entry):
+        device_registry = dr.async_get(self.hass)
+        existing_unique_ids: set[str] = {
+            entry.unique_id
+            for entry in self.hass.config_entries.async_entries(DOMAIN)
+            if entry.unique_id
+        }
+        # Many entities share the same device model, only look up each model once
+        profile_cache: dict[ModelInfo, PowerProfile | None] = {}
+        domain_supported: dict[tuple[int, str, str], bool] = {}
+        for entity_id in _get_candidate_entity_ids(entity_registry):
+            entity_entry = entity_registry.async_get(entity_id)
+            if entity_entry is None or not self.should_process_entity(entity_entry):
                 continue
 
-            model_info = await autodiscover_model(self.hass, entity_entry)
+            model_info = await autodiscover_model(
+                self.hass, entity_entry, device_registry
+            )
             if not model_info or not model_info.manufacturer or not model_info.model:
                 continue
 
-            source_entity = await create_source_entity(
-                entity_entry.entity_id, self.hass
-            )
-
             if (
                 model_info.manufacturer == MANUFACTURER_WLED
                 and entity_entry.domain == LIGHT_DOMAIN
-                and not re.search(
-                    "master|segment",
-                    str(entity_entry.original_name),
-                    flags=re.IGNORECASE,
-                )
+                and not _WLED_SUBENTITY_RE.search(entity_entry.original_name or "")
             ):
-                self._init_entity_discovery(
-                    source_entity,
+                discovery_data = self._create_discovery_data(
+                    await create_source_entity(entity_entry.entity_id, self.hass),
+                    existing_unique_ids,
                     power_profile=None,
                     extra_discovery_data={
                         CONF_MODE: CalculationStrategy.WLED,
@@ -136,38 +180,51 @@ class DiscoveryManager:
                         CONF_MODEL: model_info.model,
                     },
                 )
+                if discovery_data:
+                    discoveries.append(discovery_data)
                 continue
 
-            try:
-                power_profile = await get_power_profile(
-                    self.hass, {}, model_info=model_info
-                )
-            except ModelNotSupported:
+            if model_info not in profile_cache:
+                try:
+                    profile_cache[model_info] = await get_power_profile(
+                        self.hass, {}, model_info=model_info
+                    )
+                except ModelNotSupported:
+                    profile_cache[model_info] = None
+
+            power_profile = profile_cache[model_info]
+            if power_profile is None:
                 _LOGGER.debug(
                     "%s: Model not found in library, skipping discovery",
                     entity_entry.entity_id,
                 )
                 continue
 
-            if not power_profile.is_entity_domain_supported(source_entity):
+            # Support only depends on the profile, the domain and (for smart switches) the platform
+            domain_key = (id(power_profile), entity_entry.domain, entity_entry.platform)
+            if domain_key not in domain_supported:
+                domain_supported[domain_key] = _is_entity_domain_supported(
+                    power_profile, entity_entry
+                )
+            if not domain_supported[domain_key]:
                 continue
 
-            self._init_entity_discovery(source_entity, power_profile, {})
-
-        _LOGGER.debug("Done auto discovering entities")
+            source_entity = await create_source_entity(
+                entity_entry.entity_id, self.hass
+            )
+            discovery_data = self._create_discovery_data(
+                source_entity, existing_unique_ids, power_profile, {}
+            )
+            if discovery_data:
+                discoveries.append(discovery_data)
 
     def should_process_entity(self, entity_entry: er.RegistryEntry) -> bool:
         """Do some validations on the registry entry to see if it qualifies for discovery"""
-        if entity_entry.disabled:
-            return False
-
-        if entity_entry.domain not in DEVICE_DOMAINS.values():
-            return False
-
-        if entity_entry.entity_category in [
-            EntityCategory.CONFIG,
-            EntityCategory.DIAGNOSTIC,
-        ]:
+        if (
+            entity_entry.disabled
+            or entity_entry.domain not in _ALLOWED_DOMAINS
+            or entity_entry.entity_category in _REJECTED_CATEGORIES
+        ):
             return False
 
         has_user_config = self._is_user_configured(entity_entry.entity_id)
@@ -181,24 +238,23 @@ class DiscoveryManager:
         return True
 
     @callback
-    def _init_entity_discovery(
+    def _create_discovery_data(
         self,
         source_entity: SourceEntity,
+        existing_unique_ids: set[str],
         power_profile: PowerProfile | None,
         extra_discovery_data: Optional[dict],
-    ) -> None:
-        """Dispatch the discovery flow for a given entity"""
-        existing_entries = [
-            entry
-            for entry in self.hass.config_entries.async_entries(DOMAIN)
-            if entry.unique_id
-            in [source_entity.unique_id, f"pc_{source_entity.unique_id}"]
-        ]
-        if existing_entries:
+    ) -> dict | None:
+        """Build the discovery data for a given entity, None when it is already setup"""
+        if (
+            source_entity.unique_id in existing_unique_ids
+            or f"pc_{source_entity.unique_id}" in existing_unique_ids
+        ):
             _LOGGER.debug(
-                f"{source_entity.entity_id}: Already setup with discovery, skipping new discovery"
+                "%s: Already setup with discovery, skipping new discovery",
+                source_entity.entity_id,
             )
-            return
+            return None
 
         discovery_data = {
             CONF_ENTITY_ID: source_entity.entity_id,
@@ -213,18 +269,31 @@ class DiscoveryManager:
         if extra_discovery_data:
             discovery_data.update(extra_discovery_data)
 
-        discovery_flow.async_create_flow(
-            self.hass,
-            DOMAIN,
-            context={"source": SOURCE_INTEGRATION_DISCOVERY},
-            data=discovery_data,
-        )
+        return discovery_data
+
+    @callback
+    def _dispatch_discoveries(self, discoveries: list[dict]) -> None:
+        """Dispatch the discovery flows for all the entities found during the discovery run"""
+        for discovery_data in discoveries:
+            discovery_flow.async_create_flow(
+                self.hass,
+                DOMAIN,
+                context={"source": SOURCE_INTEGRATION_DISCOVERY},
+                data=discovery_data,
+            )
 
         # Code below if for legacy discovery routine, will be removed somewhere in the future
-        if power_profile and not power_profile.is_additional_configuration_required:
+        # The sensor platform only accepts a single discovery info, so we need a platform load per entity
+        for discovery_data in discoveries:
+            power_profile: PowerProfile | None = discovery_data.get(
+                DISCOVERY_POWER_PROFILE
+            )
+            if not power_profile or power_profile.is_additional_configuration_required:
+                continue
+
             discovery_info = {
-                CONF_ENTITY_ID: source_entity.entity_id,
-                DISCOVERY_SOURCE_ENTITY: source_entity,
+                CONF_ENTITY_ID: discovery_data[CONF_ENTITY_ID],
+                DISCOVERY_SOURCE_ENTITY: discovery_data[DISCOVERY_SOURCE_ENTITY],
                 DISCOVERY_POWER_PROFILE: power_profile,
                 DISCOVERY_TYPE: PowercalcDiscoveryType.LIBRARY,
             }
@@ -239,16 +308,16 @@ class DiscoveryManager:
         Check if user have setup powercalc sensors for a given entity_id.
         Either with the YAML or GUI method.
         """
-        if not self.manually_configured_entities:
+        if self.manually_configured_entities is None:
             self.manually_configured_entities = (
                 self._load_manually_configured_entities()
             )
 
         return entity_id in self.manually_configured_entities
 
-    def _load_manually_configured_entities(self) -> list[str]:
+    def _load_manually_configured_entities(self) -> set[str]:
         """Looks at the YAML and GUI config entries for all the configured entity_id's"""
-        entities = []
+        entities: set[str] = set()
 
         # Find entity ids in yaml config
         if SENSOR_DOMAIN in self.ha_config:
@@ -259,41 +328,47 @@ class DiscoveryManager:
                 if isinstance(item, dict) and item.get(CONF_PLATFORM) == DOMAIN
             ]
             for entry in platform_entries:
-                entities.extend(self._find_entity_ids_in_yaml_config(entry))
+                entities.update(
+                    entity_id
+                    for entity_id in self._find_entity_ids_in_yaml_config(entry)
+                    if isinstance(entity_id, str)
+                )
 
         # Add entities from existing config entries
-        entities.extend(
-            [
-                entry.data.get(CONF_ENTITY_ID)
-                for entry in self.hass.config_entries.async_entries(DOMAIN)
-                if entry.source == SOURCE_USER
-            ]
+        entities.update(
+            entry.data[CONF_ENTITY_ID]
+            for entry in self.hass.config_entries.async_entries(DOMAIN)
+            if entry.source == SOURCE_USER and entry.data.get(CONF_ENTITY_ID)
         )
 
         return entities
 
-    def _find_entity_ids_in_yaml_config(self, search_dict: dict):
+    def _find_entity_ids_in_yaml_config(self, search_dict: dict) -> list[str]:
         """
         Takes a dict with nested lists and dicts,
         and searches all dicts for a key of the field
         provided.
         """
-        found_entity_ids = []
-
-        for key, value in search_dict.items():
-            if key == "entity_id":
-                found_entity_ids.append(value)
-
-            elif isinstance(value, dict):
-                results = self._find_entity_ids_in_yaml_config(value)
-                for result in results:
-                    found_entity_ids.append(result)
-
-            elif isinstance(value, list):
-                for item in value:
-                    if isinstance(item, dict):
-                        results = self._find_entity_ids_in_yaml_config(item)
-                        for result in results:
-                            found_entity_ids.append(result)
+        # Fast path for the common case of a flat sensor entry without any nesting
+        if CONF_ENTITY_ID in search_dict and not any(
+            isinstance(value, (dict, list)) for value in search_dict.values()
+        ):
+            return [search_dict[CONF_ENTITY_ID]]
+
+        found_entity_ids: list[str] = []
+
+        stack: deque[dict | list] = deque([search_dict])
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(item for item in node if isinstance(item, dict))
+                continue
+
+            for key, value in node.items():
+                if key == CONF_ENTITY_ID:
+                    found_entity_ids.append(value)
+
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
 
         return found_entity_ids
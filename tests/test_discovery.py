@@ -1,9 +1,18 @@
 import logging
+from unittest.mock import patch
 
 import pytest
 from homeassistant.components.light import ATTR_BRIGHTNESS, ATTR_COLOR_MODE, ColorMode
+from homeassistant.components.sensor import DOMAIN as SENSOR_DOMAIN
 from homeassistant.config_entries import SOURCE_IGNORE, SOURCE_INTEGRATION_DISCOVERY
-from homeassistant.const import CONF_ENTITY_ID, CONF_NAME, CONF_UNIQUE_ID, STATE_ON
+from homeassistant.const import (
+    CONF_ENTITIES,
+    CONF_ENTITY_ID,
+    CONF_NAME,
+    CONF_PLATFORM,
+    CONF_UNIQUE_ID,
+    STATE_ON,
+)
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.device_registry import DeviceEntry
 from homeassistant.helpers.entity import EntityCategory
@@ -20,16 +29,18 @@ from pytest_homeassistant_custom_component.common import (
 )
 
 from custom_components.powercalc.const import (
+    CONF_CREATE_GROUP,
     CONF_ENABLE_AUTODISCOVERY,
     CONF_FIXED,
     CONF_MANUFACTURER,
     CONF_MODEL,
     CONF_POWER,
     CONF_SENSOR_TYPE,
+    DISCOVERY_POWER_PROFILE,
     DOMAIN,
     SensorType,
 )
-from custom_components.powercalc.discovery import autodiscover_model
+from custom_components.powercalc.discovery import DiscoveryManager, autodiscover_model
 from custom_components.powercalc.power_profile.factory import get_power_profile
 from custom_components.test.light import MockLight
 
@@ -72,6 +83,38 @@ async def test_autodiscovery(hass: HomeAssistant, mock_flow_init) -> None:
     assert not hass.states.get("sensor.testc_power")
 
 
+async def test_autodiscovery_looks_up_shared_model_once(
+    hass: HomeAssistant, mock_flow_init
+) -> None:
+    """Entities sharing the same device model should reuse the power profile lookup"""
+
+    lighta = MockLight("testa")
+    lighta.manufacturer = "signify"
+    lighta.model = "LCA001"
+
+    lightb = MockLight("testb")
+    lightb.manufacturer = "signify"
+    lightb.model = "LCA001"
+    await create_mock_light_entity(hass, [lighta, lightb])
+
+    with patch(
+        "custom_components.powercalc.discovery.get_power_profile",
+        wraps=get_power_profile,
+    ) as mock_get_power_profile:
+        await async_setup_component(hass, DOMAIN, {})
+        await hass.async_block_till_done()
+
+    assert mock_get_power_profile.call_count == 1
+
+    mock_calls = mock_flow_init.mock_calls
+    assert len(mock_calls) == 2
+    assert mock_calls[0][2]["data"][CONF_ENTITY_ID] == "light.testa"
+    assert mock_calls[1][2]["data"][CONF_ENTITY_ID] == "light.testb"
+    power_profile = mock_calls[0][2]["data"][DISCOVERY_POWER_PROFILE]
+    assert power_profile
+    assert mock_calls[1][2]["data"][DISCOVERY_POWER_PROFILE] is power_profile
+
+
 async def test_discovery_skipped_when_confirmed_by_user(
     hass: HomeAssistant, mock_flow_init
 ) -> None:
@@ -161,6 +204,81 @@ async def test_manually_configured_light_overrides_autodiscovered(
     assert state.state == "25.00"
 
 
+async def test_load_manually_configured_entities(hass: HomeAssistant) -> None:
+    """
+    Manually configured entity id's are collected in a set.
+    Config entries without entity_id (i.e. groups) and non string YAML values must be left out
+    """
+    MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_SENSOR_TYPE: SensorType.GROUP, CONF_NAME: "My group"},
+    ).add_to_hass(hass)
+    MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_SENSOR_TYPE: SensorType.VIRTUAL_POWER,
+            CONF_ENTITY_ID: "light.gui",
+            CONF_FIXED: {CONF_POWER: 20},
+        },
+    ).add_to_hass(hass)
+
+    discovery_manager = DiscoveryManager(
+        hass,
+        {
+            SENSOR_DOMAIN: [
+                {
+                    CONF_PLATFORM: DOMAIN,
+                    CONF_CREATE_GROUP: "My YAML group",
+                    CONF_ENTITIES: [
+                        {CONF_ENTITY_ID: "light.yaml"},
+                        {CONF_ENTITY_ID: ["light.a", "light.b"]},
+                    ],
+                }
+            ]
+        },
+    )
+
+    assert discovery_manager._load_manually_configured_entities() == {
+        "light.gui",
+        "light.yaml",
+    }
+
+
+async def test_empty_manually_configured_entities_loaded_once(
+    hass: HomeAssistant,
+) -> None:
+    """When nothing is configured manually, the configuration should not be reloaded for every entity"""
+    discovery_manager = DiscoveryManager(hass, {})
+    with patch.object(
+        discovery_manager,
+        "_load_manually_configured_entities",
+        wraps=discovery_manager._load_manually_configured_entities,
+    ) as mock_load:
+        assert not discovery_manager._is_user_configured("light.testa")
+        assert not discovery_manager._is_user_configured("light.testb")
+
+    assert mock_load.call_count == 1
+
+
+async def test_partial_yaml_config_complements_device_information(
+    hass: HomeAssistant,
+) -> None:
+    """
+    When the device registry only knows the manufacturer, the model supplied in the YAML configuration
+    should be combined with it to find the power profile
+    """
+    light_entity = MockLight("testa")
+    light_entity.manufacturer = "signify"
+    light_entity.model = None
+    await create_mock_light_entity(hass, light_entity)
+
+    await run_powercalc_setup(
+        hass, {CONF_ENTITY_ID: "light.testa", CONF_MODEL: "LCA001"}, {}
+    )
+
+    assert hass.states.get("sensor.testa_power")
+
+
 async def test_config_entry_overrides_autodiscovered(
     hass: HomeAssistant, caplog: pytest.LogCaptureFixture
 ) -> None:
@@ -423,3 +541,31 @@ async def test_no_power_sensors_are_created_for_ignored_config_entries(
 
     assert not hass.states.get("sensor.test_power")
     assert "Already setup with discovery, skipping new discovery" in caplog.text
+
+
+async def test_find_entity_ids_in_nested_yaml_config(hass: HomeAssistant) -> None:
+    """
+    Entity id's must be found in nested groups and dicts
+    Lists nested directly inside lists are not searched
+    """
+    discovery_manager = DiscoveryManager(hass, {})
+    entity_ids = discovery_manager._find_entity_ids_in_yaml_config(
+        {
+            CONF_CREATE_GROUP: "Group A",
+            CONF_ENTITIES: [
+                {CONF_ENTITY_ID: "light.a", CONF_FIXED: {CONF_POWER: 20}},
+                {
+                    CONF_CREATE_GROUP: "Group B",
+                    CONF_ENTITIES: [
+                        {CONF_ENTITY_ID: "light.b"},
+                        [{CONF_ENTITY_ID: "light.c"}],
+                    ],
+                },
+            ],
+        }
+    )
+    assert sorted(entity_ids) == ["light.a", "light.b"]
+
+    assert discovery_manager._find_entity_ids_in_yaml_config(
+        {CONF_ENTITY_ID: "light.d", CONF_NAME: "Light D"}
+    ) == ["light.d"]